@@ -1,18 +1,21 @@
-import contextlib
+import functools
 import gzip
 import hashlib
 import json
 import logging
 import os
-import shutil
 import subprocess
-from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+import zlib
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple, Union
 from urllib import parse
 
 from .logging_config import configure_logger
 
 logger = configure_logger("FlowAnalyzer", logging.INFO)
 
+# 查找HTTP头结束位置时优先搜索的字节数
+HEADER_SEARCH_WINDOW = 16 * 1024
+
 class Request(NamedTuple):
     frame_num: Optional[int]
     header: bytes
@@ -59,14 +62,101 @@ class FlowAnalyzer:
         ValueError
             当JSON文件内容为空时抛出异常
         """
-        if not os.path.exists(self.jsonPath):
-            raise FileNotFoundError("您的tshark导出的JSON文件没有找到！JSON路径：%s" % self.jsonPath)
+        try:
+            stat = os.stat(self.jsonPath)
+        except FileNotFoundError:
+            raise FileNotFoundError("您的tshark导出的JSON文件没有找到！JSON路径：%s" % self.jsonPath) from None
 
-        if os.path.getsize(self.jsonPath) == 0:
+        if stat.st_size == 0:
             raise ValueError("您的tshark导出的JSON文件内容为空！JSON路径：%s" % self.jsonPath)
 
-    def parse_http_json(self) -> Tuple[Dict[int, Request], Dict[int, Response]]:
+    @staticmethod
+    def iter_json_packets(jsonPath: str, blockSize: int = 1 << 20) -> Iterator[dict]:
+        """逐个读取tshark导出的JSON数组中的数据包, 不会把整个JSON文件载入内存
+
+        Parameters
+        ----------
+        jsonPath : str
+            tshark导出的JSON文件路径
+        blockSize : int
+            每次从文件读取的字符数
+
+        Yields
+        ------
+        Iterator[dict]
+            JSON数组中的每一个数据包
+
+        Raises
+        ------
+        ValueError
+            当JSON文件内容不是数组, 或者数组不完整、格式错误时抛出异常
+        """
+        decoder = json.JSONDecoder()
+        with open(jsonPath, "r", encoding="utf-8") as f:
+            buffer = f.read(blockSize).lstrip()
+            while not buffer:
+                more = f.read(blockSize)
+                if not more:
+                    break
+                buffer = more.lstrip()
+            if not buffer.startswith("["):
+                raise ValueError("您的tshark导出的JSON文件不是数组格式！JSON路径：%s" % jsonPath)
+
+            pos, eof = 1, False
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if buffer.startswith("]", pos):
+                    return
+
+                try:
+                    packet, pos = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise ValueError("您的tshark导出的JSON文件不完整或已损坏！JSON路径：%s" % jsonPath) from None
+                    more = f.read(max(blockSize, len(buffer) - pos))
+                    eof = not more
+                    buffer, pos = buffer[pos:] + more, 0
+                    continue
+                yield packet
+
+    def iter_http_packets(self) -> Iterator[Union[Request, Response]]:
         # sourcery skip: use-named-expression
+        """按帧顺序逐个解析JSON数据文件中的HTTP请求和响应信息
+
+        Yields
+        ------
+        Iterator[Union[Request, Response]]
+            HTTP请求或响应信息
+        """
+        extract_http_file_data = self.extract_http_file_data
+        for packet in self.iter_json_packets(self.jsonPath):
+            get = packet["_source"]["layers"].get
+            isResponse = bool(get("http.response_number"))
+            if not isResponse and not get("http.request_number"):
+                continue
+
+            full_request = get("tcp.reassembled.data") or get("tcp.payload")
+            if not full_request:
+                continue
+
+            time_epoch = get("frame.time_epoch")
+            time_epoch = float(time_epoch[0]) if time_epoch else None
+            frame_num = get("frame.number")
+            frame_num = int(frame_num[0]) if frame_num else None
+            request_in = get("http.request_in")
+            request_in = int(request_in[0]) if request_in else frame_num
+            full_uri = get("http.request.full_uri")
+            full_uri = parse.unquote(full_uri[0]) if full_uri else None
+
+            header, file_data = extract_http_file_data(full_request[0])
+
+            if isResponse:
+                yield Response(frame_num, header, file_data, request_in, time_epoch)
+            else:
+                yield Request(frame_num, header, file_data, full_uri, time_epoch)
+
+    def parse_http_json(self) -> Tuple[Dict[int, Request], Dict[int, Response]]:
         """解析JSON数据文件中的HTTP请求和响应信息
 
         Returns
@@ -74,87 +164,145 @@ class FlowAnalyzer:
         tuple
             包含请求字典和响应列表的元组
         """
-        with open(self.jsonPath, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
         requests, responses = {}, {}
-        for packet in data:
-            packet = packet["_source"]["layers"]
-            time_epoch = float(packet["frame.time_epoch"][0]) if packet.get("frame.time_epoch") else None
-            full_request = (
-                packet["tcp.reassembled.data"][0] if packet.get("tcp.reassembled.data") else packet["tcp.payload"][0]
-            )
-            frame_num = int(packet["frame.number"][0]) if packet.get("frame.number") else None
-            request_in = int(packet["http.request_in"][0]) if packet.get("http.request_in") else frame_num
-            full_uri = (
-                parse.unquote(packet["http.request.full_uri"][0]) if packet.get("http.request.full_uri") else None
-            )
-
-            header, file_data = self.extract_http_file_data(full_request)
-
-            if packet.get("http.response_number"):
-                responses[frame_num] = Response(
-                    frame_num=frame_num,
-                    request_in=request_in,
-                    header=header,
-                    file_data=file_data,
-                    time_epoch=time_epoch,
-                )
+        for packet in self.iter_http_packets():
+            if isinstance(packet, Response):
+                responses[packet.frame_num] = packet
             else:
-                requests[frame_num] = Request(
-                    frame_num=frame_num, header=header, file_data=file_data, time_epoch=time_epoch, full_uri=full_uri
-                )
+                requests[packet.frame_num] = packet
         return requests, responses
 
-    def generate_http_dict_pairs(self) -> Iterable[HttpPair]:  # sourcery skip: use-named-expression
+    def generate_http_dict_pairs(self) -> Iterable[HttpPair]:
         """生成HTTP请求和响应信息的字典对
+
+        请求在收到最终响应时与其配对输出; 100 Continue等1xx临时响应不参与配对, 以request为None单独输出;
+        找不到对应请求的响应在出现时输出, 没有收到最终响应的请求在最后输出
+
         Yields
         ------
         Iterable[HttpPair]
             包含请求和响应信息的字典迭代器
         """
-        requests, responses = self.parse_http_json()
-        response_map = {r.request_in: r for r in responses.values()}
-        yielded_resps = []
-        for req_id, req in requests.items():
-            resp = response_map.get(req_id)
-            if resp:
-                yielded_resps.append(resp)
-                resp = resp._replace(request_in=None)
+        pending: Dict[int, Request] = {}
+        for packet in self.iter_http_packets():
+            if not isinstance(packet, Response):
+                pending[packet.frame_num] = packet
+                continue
+
+            resp = packet._replace(request_in=None)
+            if self._is_interim_response(packet.header):
+                yield HttpPair(request=None, response=resp)
+                continue
+
+            req = pending.pop(packet.request_in, None)
+            if req:
                 yield HttpPair(request=req, response=resp)
             else:
-                yield HttpPair(request=req, response=None)
-
-        for resp in response_map.values():
-            if resp not in yielded_resps:
-                resp = resp._replace(request_in=None)
                 yield HttpPair(request=None, response=resp)
 
+        for req in pending.values():
+            yield HttpPair(request=req, response=None)
+
+    @staticmethod
+    def _is_interim_response(header: bytes) -> bool:
+        """判断响应是否为1xx临时响应, 101 Switching Protocols是协议切换前的最终响应, 不算临时响应
+
+        Parameters
+        ----------
+        header : bytes
+            HTTP响应头
+
+        Returns
+        -------
+        bool
+            是否为1xx临时响应
+        """
+        statusLine = header[:16].split(b" ", 2)
+        return (
+            len(statusLine) > 1
+            and statusLine[0].startswith(b"HTTP/")
+            and len(statusLine[1]) == 3
+            and statusLine[1].startswith(b"1")
+            and statusLine[1] != b"101"
+        )
+
     @staticmethod
     def get_hash(filePath: str, display_filter: str) -> str:
+        stat = os.stat(filePath)
+        return FlowAnalyzer._get_hash_cached(os.path.abspath(filePath), display_filter, stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def _get_hash_cached(filePath: str, display_filter: str, mtime_ns: int, size: int) -> str:
+        sha256 = hashlib.sha256()
         with open(filePath, "rb") as f:
-            return hashlib.md5(f.read() + display_filter.encode()).hexdigest()
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(block)
+        sha256.update(display_filter.encode())
+        return sha256.hexdigest()
 
     @staticmethod
     def extract_json_file(fileName: str, display_filter: str, tshark_workDir: str) -> None:
-        # sourcery skip: replace-interpolation-with-fstring, use-fstring-for-formatting
-        # tshark -r {} -Y "{}" -T json -e http.request_number -e http.response_number -e http.request_in -e tcp.reassembled.data -e frame.number -e tcp.payload -e frame.time_epoch -e http.request.full_uri > output.json
-        command = (
-            'tshark -r {} -Y "{}" -T json '
-            '-e http.request_number '
-            '-e http.response_number '
-            '-e http.request_in '
-            '-e tcp.reassembled.data '
-            '-e frame.number '
-            '-e tcp.payload '
-            '-e frame.time_epoch '
-            '-e http.request.full_uri '
-            '> output.json'.format(
-                fileName, display_filter
-        ))
-        _, stderr = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=tshark_workDir).communicate()
-        if stderr != b"" and b"WARNING" not in stderr:
-            print(f"[Waring/Error]: {stderr}")
+        FlowAnalyzer._run_tshark(
+            os.path.join(tshark_workDir, fileName), display_filter, os.path.join(tshark_workDir, "output.json")
+        )
+
+    @staticmethod
+    def _run_tshark(filePath: str, display_filter: str, jsonPath: str) -> str:
+        # sourcery skip: replace-interpolation-with-fstring
+        """调用tshark将流量包导出为JSON文件, tshark执行失败且没有导出任何内容时删除JSON文件并抛出异常
+
+        Parameters
+        ----------
+        filePath : str
+            待处理的数据文件路径
+        display_filter : str
+            WireShark的显示过滤器
+        jsonPath : str
+            导出的JSON文件路径
+
+        Returns
+        -------
+        str
+            tshark的错误输出
+
+        Raises
+        ------
+        FileNotFoundError
+            当没有找到tshark时抛出异常
+        RuntimeError
+            当tshark返回非0值并且没有导出任何内容时抛出异常
+        """
+        # tshark -r {filePath} -Y "{display_filter}" -T json -e http.request_number -e http.response_number -e http.request_in -e tcp.reassembled.data -e frame.number -e tcp.payload -e frame.time_epoch -e http.request.full_uri > {jsonPath}
+        command = [
+            "tshark", "-r", filePath, "-Y", display_filter, "-T", "json",
+            "-e", "http.request_number",
+            "-e", "http.response_number",
+            "-e", "http.request_in",
+            "-e", "tcp.reassembled.data",
+            "-e", "frame.number",
+            "-e", "tcp.payload",
+            "-e", "frame.time_epoch",
+            "-e", "http.request.full_uri",
+        ]
+        with open(jsonPath, "wb") as f:
+            try:
+                result = subprocess.run(command, stdout=f, stderr=subprocess.PIPE)
+            except FileNotFoundError:
+                result = None
+
+        if result is None:
+            os.remove(jsonPath)
+            raise FileNotFoundError("没有找到tshark！请将tshark添加到环境变量")
+
+        stderr = result.stderr.decode("utf-8", "replace").strip()
+        if result.returncode != 0 and os.path.getsize(jsonPath) == 0:
+            os.remove(jsonPath)
+            raise RuntimeError("tshark执行失败！返回值：%d，错误信息：%s" % (result.returncode, stderr))
+
+        if stderr and (result.returncode != 0 or "WARNING" not in stderr):
+            logger.warning("[Waring/Error]: %s", stderr)
+        return stderr
 
     @staticmethod
     def get_json_data(filePath: str, display_filter: str) -> str:
@@ -176,52 +324,71 @@ class FlowAnalyzer:
         if not os.path.exists(filePath):
             raise FileNotFoundError("您的填写的流量包没有找到！流量包路径：%s" % filePath)
 
-        MD5Sum = FlowAnalyzer.get_hash(filePath, display_filter)
-        workDir = os.getcwd()
-        tshark_workDir = os.path.dirname(filePath)
-        tshark_jsonPath = os.path.join(tshark_workDir, "output.json")
-        jsonWordPath = os.path.join(workDir, "output.json")
-        fileName = os.path.basename(filePath)
-
-        if os.path.exists(jsonWordPath):
-            with open(jsonWordPath, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            if data[0].get('MD5Sum') == MD5Sum:
-                logger.debug("匹配HASH校验无误，自动返回Json文件路径!")
-                return jsonWordPath
-        FlowAnalyzer.extract_json_file(fileName, display_filter, tshark_workDir)
-
-        if tshark_jsonPath != jsonWordPath:
-            shutil.move(tshark_jsonPath, jsonWordPath)
-        
-        with open(jsonWordPath, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        data[0]['MD5Sum'] = MD5Sum
-        
-        with open(jsonWordPath, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
+        fileHash = FlowAnalyzer.get_hash(filePath, display_filter)
+        jsonWordPath = os.path.join(os.getcwd(), "output.json")
+        hashPath = jsonWordPath + ".sha256"
+
+        if os.path.exists(jsonWordPath) and os.path.exists(hashPath):
+            with open(hashPath, "r", encoding="utf-8") as f:
+                if f.read().strip() == fileHash:
+                    logger.debug("匹配HASH校验无误，自动返回Json文件路径!")
+                    return jsonWordPath
+
+        if os.path.exists(hashPath):
+            os.remove(hashPath)
+        stderr = FlowAnalyzer._run_tshark(filePath, display_filter, jsonWordPath)
+        if os.path.getsize(jsonWordPath) == 0:
+            raise ValueError("tshark导出的JSON文件内容为空！JSON路径：%s，错误信息：%s" % (jsonWordPath, stderr))
+
+        with open(hashPath, "w", encoding="utf-8") as f:
+            f.write(fileHash)
         return jsonWordPath
 
+    def Find_HTTP_header_end(self, file_data: bytes) -> int:
+        """查找HTTP头的结束位置, 也就是请求体/响应体的起始位置
+
+        Parameters
+        ----------
+        file_data : bytes
+            HTTP请求或响应的原始字节流
+
+        Returns
+        -------
+        int
+            HTTP头结束位置, 没有找到时返回0
+        """
+        searches = (
+            (0, 0, HEADER_SEARCH_WINDOW),
+            (HEADER_SEARCH_WINDOW - 3, HEADER_SEARCH_WINDOW - 1, len(file_data)),
+        )
+        for crlfStart, lfStart, searchEnd in searches:
+            headerEnd = file_data.find(b"\r\n\r\n", crlfStart, searchEnd)
+            if headerEnd != -1:
+                return headerEnd + 4
+
+            headerEnd = file_data.find(b"\n\n", lfStart, searchEnd)
+            if headerEnd != -1:
+                return headerEnd + 2
+
+            if searchEnd >= len(file_data):
+                break
+
+        logger.debug("没有找到headers和response的划分位置!")
+        return 0
+
     def Split_HTTP_headers(self, file_data: bytes) -> Tuple[bytes, bytes]:
-        # sourcery skip: use-named-expression
-        headerEnd = file_data.find(b"\r\n\r\n")
-        if headerEnd != -1:
-            headerEnd += 4
-            return file_data[:headerEnd], file_data[headerEnd:]
-        elif file_data.find(b"\n\n") != -1:
-            headerEnd = file_data.index(b"\n\n") + 2
-            return file_data[:headerEnd], file_data[headerEnd:]
-        else:
-            print("[Warning] 没有找到headers和response的划分位置!")
-            return b"", file_data
-
-    def Dechunck_HTTP_response(self, file_data: bytes) -> bytes:
+        headerEnd = self.Find_HTTP_header_end(file_data)
+        return file_data[:headerEnd], file_data[headerEnd:]
+
+    def Dechunck_HTTP_response(self, file_data: bytes, start: int = 0) -> bytes:
         """解码分块TCP数据
 
         Parameters
         ----------
         file_data : bytes
-            已经切割掉headers的TCP数据
+            TCP数据
+        start : int
+            分块数据在file_data中的起始位置, 默认为0即file_data已经切割掉headers
 
         Returns
         -------
@@ -229,19 +396,46 @@ class FlowAnalyzer:
             解码分块后的TCP数据
         """
         chunks = []
-        chunkSizeEnd = file_data.find(b"\n") + 1
-        lineEndings = b"\r\n" if bytes([file_data[chunkSizeEnd - 2]]) == b"\r" else b"\n"
+        chunkSizeEnd = file_data.find(b"\n", start) + 1
+        if not chunkSizeEnd:
+            raise ValueError("没有找到分块长度所在行!")
+
+        lineEndings = b"\r\n" if file_data[chunkSizeEnd - 2 : chunkSizeEnd - 1] == b"\r" else b"\n"
         lineEndingsLength = len(lineEndings)
+
+        chunkEnd = chunkSizeEnd + FlowAnalyzer._parse_chunk_size(file_data[start:chunkSizeEnd])
+        if file_data.startswith(lineEndings + b"0" + lineEndings, chunkEnd):
+            return file_data[chunkSizeEnd:chunkEnd]
+
+        view = memoryview(file_data)
+        cursor = start
         while True:
-            chunkSize = int(file_data[:chunkSizeEnd], 16)
+            chunkSize = FlowAnalyzer._parse_chunk_size(file_data[cursor:chunkSizeEnd])
             if not chunkSize:
                 break
 
-            chunks.append(file_data[chunkSizeEnd : chunkSize + chunkSizeEnd])
-            file_data = file_data[chunkSizeEnd + chunkSize + lineEndingsLength :]
-            chunkSizeEnd = file_data.find(lineEndings) + lineEndingsLength
+            chunks.append(view[chunkSizeEnd : chunkSizeEnd + chunkSize])
+            cursor = chunkSizeEnd + chunkSize + lineEndingsLength
+            chunkSizeEnd = file_data.find(lineEndings, cursor)
+            if chunkSizeEnd == -1:
+                raise ValueError("分块数据不完整!")
+            chunkSizeEnd += lineEndingsLength
         return b"".join(chunks)
 
+    @staticmethod
+    def _parse_chunk_size(sizeLine: bytes) -> int:
+        """解析分块长度所在行, 只接受十六进制数字, 不接受int()允许的正负号、0x前缀和下划线
+
+        Raises
+        ------
+        ValueError
+            当分块长度不是合法的十六进制数时抛出异常
+        """
+        sizeLine = sizeLine.strip()
+        if not sizeLine or sizeLine.strip(b"0123456789abcdefABCDEF"):
+            raise ValueError("分块长度不是合法的十六进制数!")
+        return int(sizeLine, 16)
+
     def extract_http_file_data(self, full_request: str) -> Tuple[bytes, bytes]:
         """提取HTTP请求或响应中的文件数据
 
@@ -255,12 +449,24 @@ class FlowAnalyzer:
         tuple
             包含header和file_data的元组
         """
-        header, file_data = self.Split_HTTP_headers(bytes.fromhex(full_request))
-
-        with contextlib.suppress(Exception):
-            file_data = self.Dechunck_HTTP_response(file_data)
-
-        with contextlib.suppress(Exception):
-            if file_data.startswith(b"\x1F\x8B"):
+        full_data = bytes.fromhex(full_request)
+        headerEnd = self.Find_HTTP_header_end(full_data)
+        header = full_data[:headerEnd]
+        if headerEnd == len(full_data):
+            return header, b""
+
+        file_data = memoryview(full_data)[headerEnd:]
+
+        lowerHeader = header.lower()
+        if b"transfer-encoding" in lowerHeader and b"chunked" in lowerHeader:
+            try:
+                file_data = self.Dechunck_HTTP_response(full_data, headerEnd)
+            except ValueError:
+                pass
+
+        if file_data[:2] == b"\x1F\x8B":
+            try:
                 file_data = gzip.decompress(file_data)
-        return header, file_data
+            except (OSError, EOFError, zlib.error):
+                pass
+        return header, bytes(file_data)
@@ -0,0 +1,46 @@
+import unittest
+
+from FlowAnalyzer import FlowAnalyzer
+
+CHUNKED_HEADER = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+
+
+class DechunkTest(unittest.TestCase):
+    def setUp(self):
+        self.analyzer = FlowAnalyzer.__new__(FlowAnalyzer)
+
+    def dechunk(self, body: bytes) -> bytes:
+        return self.analyzer.Dechunck_HTTP_response(body)
+
+    def extract_body(self, body: bytes) -> bytes:
+        return self.analyzer.extract_http_file_data((CHUNKED_HEADER + body).hex())[1]
+
+    def test_single_chunk(self):
+        self.assertEqual(self.dechunk(b"5\r\nhello\r\n0\r\n\r\n"), b"hello")
+
+    def test_multiple_chunks(self):
+        self.assertEqual(self.dechunk(b"5\r\nhello\r\n1\r\n \r\na\r\n0123456789\r\n0\r\n\r\n"), b"hello 0123456789")
+
+    def test_lf_only(self):
+        self.assertEqual(self.dechunk(b"5\nhello\n6\n world\n0\n\n"), b"hello world")
+
+    def test_start_offset(self):
+        self.assertEqual(self.analyzer.Dechunck_HTTP_response(b"xx3\r\nabc\r\n0\r\n\r\n", 2), b"abc")
+
+    def test_truncated(self):
+        for body in (b"5\r\nhel", b"5\r\nhello\r\n", b"5\r\nhello\r\n3\r\nab"):
+            with self.subTest(body=body):
+                with self.assertRaises(ValueError):
+                    self.dechunk(body)
+                self.assertEqual(self.extract_body(body), body)
+
+    def test_invalid_size(self):
+        for body in (b"-6\r\n", b"-7\r\n52f\n7", b"5\r\nhello\r\n-5\r\nworld\r\n0\r\n\r\n", b"0x5\r\nhello\r\n0\r\n\r\n", b"zz\r\n"):
+            with self.subTest(body=body):
+                with self.assertRaises(ValueError):
+                    self.dechunk(body)
+                self.assertEqual(self.extract_body(body), body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+import unittest
+
+from FlowAnalyzer import FlowAnalyzer
+
+
+def request_packet(frame_num: int, payload: bytes) -> dict:
+    return {
+        "_source": {
+            "layers": {
+                "frame.number": [str(frame_num)],
+                "http.request_number": ["1"],
+                "tcp.payload": [payload.hex()],
+            }
+        }
+    }
+
+
+def response_packet(frame_num: int, request_in: int, payload: bytes) -> dict:
+    return {
+        "_source": {
+            "layers": {
+                "frame.number": [str(frame_num)],
+                "http.response_number": ["1"],
+                "http.request_in": [str(request_in)],
+                "tcp.payload": [payload.hex()],
+            }
+        }
+    }
+
+
+OK = b"HTTP/1.1 200 OK\r\n\r\nok"
+CONTINUE = b"HTTP/1.1 100 Continue\r\n\r\n"
+SWITCHING = b"HTTP/1.1 101 Switching Protocols\r\n\r\n"
+
+
+class GenerateHttpDictPairsTest(unittest.TestCase):
+    def pairs(self, packets: list) -> list:
+        fd, jsonPath = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(packets, f)
+        self.addCleanup(os.remove, jsonPath)
+        return [
+            (
+                http.request.frame_num if http.request else None,
+                http.response.frame_num if http.response else None,
+            )
+            for http in FlowAnalyzer(jsonPath).generate_http_dict_pairs()
+        ]
+
+    def test_matched_pair(self):
+        packets = [request_packet(1, b"GET / HTTP/1.1\r\n\r\n"), response_packet(2, 1, OK)]
+        self.assertEqual(self.pairs(packets), [(1, 2)])
+
+    def test_orphan_response(self):
+        self.assertEqual(self.pairs([response_packet(5, 99, OK)]), [(None, 5)])
+
+    def test_unanswered_request(self):
+        packets = [
+            request_packet(1, b"GET /a HTTP/1.1\r\n\r\n"),
+            request_packet(2, b"GET /b HTTP/1.1\r\n\r\n"),
+            response_packet(3, 2, OK),
+        ]
+        self.assertEqual(self.pairs(packets), [(2, 3), (1, None)])
+
+    def test_interim_response_before_final(self):
+        packets = [
+            request_packet(1, b"POST /upload HTTP/1.1\r\nExpect: 100-continue\r\n\r\ndata"),
+            response_packet(2, 1, CONTINUE),
+            response_packet(3, 1, OK),
+        ]
+        self.assertEqual(self.pairs(packets), [(None, 2), (1, 3)])
+
+    def test_switching_protocols_is_final(self):
+        packets = [request_packet(1, b"GET /ws HTTP/1.1\r\nUpgrade: websocket\r\n\r\n"), response_packet(2, 1, SWITCHING)]
+        self.assertEqual(self.pairs(packets), [(1, 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+import unittest
+
+from FlowAnalyzer import FlowAnalyzer
+
+PACKETS = [
+    {"_source": {"layers": {"frame.number": ["1"], "tcp.payload": ["474554202f5d2c7b"]}}},
+    {"_source": {"layers": {"frame.number": ["2"], "http.request.full_uri": ["http://x/a,b]{c}\"d"]}}},
+    {"_source": {"layers": {}}},
+]
+
+
+class IterJsonPacketsTest(unittest.TestCase):
+    def write_json(self, content: str) -> str:
+        fd, jsonPath = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        self.addCleanup(os.remove, jsonPath)
+        return jsonPath
+
+    def test_small_block_sizes(self):
+        jsonPath = self.write_json(json.dumps(PACKETS, indent=2))
+        for blockSize in (1, 2, 3, 7, 50, 1 << 20):
+            with self.subTest(blockSize=blockSize):
+                self.assertEqual(list(FlowAnalyzer.iter_json_packets(jsonPath, blockSize)), PACKETS)
+
+    def test_leading_whitespace(self):
+        jsonPath = self.write_json("\n  " + json.dumps(PACKETS))
+        for blockSize in (1, 2, 1 << 20):
+            with self.subTest(blockSize=blockSize):
+                self.assertEqual(list(FlowAnalyzer.iter_json_packets(jsonPath, blockSize)), PACKETS)
+
+    def test_empty_array(self):
+        for content in ("[]", "[\n]\n", "  [ ]"):
+            jsonPath = self.write_json(content)
+            for blockSize in (1, 1 << 20):
+                with self.subTest(content=content, blockSize=blockSize):
+                    self.assertEqual(list(FlowAnalyzer.iter_json_packets(jsonPath, blockSize)), [])
+
+    def test_truncated(self):
+        content = json.dumps(PACKETS, indent=2)
+        for end in (1, len(content) // 2, len(content) - 1):
+            jsonPath = self.write_json(content[:end])
+            for blockSize in (3, 1 << 20):
+                with self.subTest(end=end, blockSize=blockSize):
+                    with self.assertRaisesRegex(ValueError, "不完整"):
+                        list(FlowAnalyzer.iter_json_packets(jsonPath, blockSize))
+
+    def test_not_an_array(self):
+        jsonPath = self.write_json('{"_source": {}}')
+        with self.assertRaisesRegex(ValueError, "不是数组格式"):
+            list(FlowAnalyzer.iter_json_packets(jsonPath))
+
+
+if __name__ == "__main__":
+    unittest.main()